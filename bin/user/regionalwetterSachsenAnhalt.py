@@ -160,8 +160,10 @@ class RwsaThread(weewx.restx.RESTThread):
     #             '9Version=2',
     #             'xBeginData')
 
+    # Default field layout. It is copied to each instance and adapted there
+    # according to the configuration, so do not change it in place.
     #                   variable, duration, aggregation, format
-    _DATA_MAP = [       ('station','','attr','{}'),
+    _DATA_MAP = (       ('station','','attr','{}'),
                         ('zip_code','','attr','{}'),
                         ('state_code','','attr','{}'),
                         ('location','','attr','{}'),
@@ -204,7 +206,20 @@ class RwsaThread(weewx.restx.RESTThread):
                         ('GTS','Day','last','{:.1f}'), # Grünlandtemperatur
                         ('GTSdate','Day','last','%d.%m.%Y'), # GLT 200 Datum
                         ('','','','%d.%m.%Y') # GLT 200 Vorjahr
-                ]
+                )
+
+    # Values read directly from the archive table in get_record(). Columns
+    # not present in the archive are dropped with the first record.
+    #                   SQL function, archive column, record key, unit group
+    _DAY_COLUMNS = (    ('MIN','outTemp','outTempDayMin',None),
+                        ('MAX','outTemp','outTempDayMax',None),
+                        ('MIN','windchill','windchillDayMin',None),
+                        ('MAX','UV','UVDayMax',None))
+    _AGO1_COLUMNS = (   ('','outTemp','outTemp1h','group_temperature'),
+                        ('','barometer','barometer1h',None),
+                        ('','pressure','pressure1h',None))
+    _H1_COLUMNS = (     ('MIN','windchill','windchill1hMin','group_temperature'),
+                        ('MAX','radiation','radiation1hMax','group_radiation'))
 
     # Note: The units Regionalwetter Sachsen-Anhalt requests are not fully 
     # covered by one of the standard unit systems. See function 
@@ -271,23 +286,34 @@ class RwsaThread(weewx.restx.RESTThread):
             self.altitude=None
         loginf("Altitude %s ==> %.0f m" % (altitude,self.altitude))
         
+        # field layout of this instance
+        self.data_map = list(self._DATA_MAP)
+
         # 5cm temperature
         try:
             if T5CM and T5CM.lower()!='none':
-                self._DATA_MAP[19] = (T5CM,'Day','min','{:.1f}')
+                self.data_map[19] = (T5CM,'Day','min','{:.1f}')
         except Exception:
             pass
         
         # sunshine duration
         try:
             if daySunD and daySunD.lower()!='none':
-                self._DATA_MAP[30] = (daySunD,'Day','sum','sunshine')
+                self.data_map[30] = (daySunD,'Day','sum','sunshine')
         except Exception:
             pass
         
+        # aggregations and SQL queries, set up by check_fields() when
+        # the first record is processed
+        self.fields_checked = False
+        self.aggregate_fields = []
+        self.day_sql = None
+        self.ago1_sql = None
+        self.h1_sql = None
+        
         # report field names to syslog
         __x=""
-        for __i in self._DATA_MAP:
+        for __i in self.data_map:
             try:
                 __x="%s (%s%s%s)" % (__x,__i[0],__i[1].capitalize(),__i[2].capitalize())
             except (TypeError,ValueError,IndexError):
@@ -300,6 +326,84 @@ class RwsaThread(weewx.restx.RESTThread):
             __x="%s %s:%s" % (__x,__i,self._UNIT_MAP[__i])
         loginf("Special units:%s" % __x)
 
+    def check_fields(self, dbmanager):
+        """Check the field layout against the archive schema and the 
+        registered xtypes.
+        
+        Fields that cannot be provided are set to 'n.v.', so that no
+        database queries are spent on them afterwards. If the archive
+        cannot be read, the complete field layout is kept."""
+    
+        # archive schema and time span to probe the aggregations
+        try:
+            if dbmanager is None:
+                __sqlkeys = []
+            else:
+                __sqlkeys = dbmanager.sqlkeys
+                __ts = dbmanager.lastGoodStamp() or time.time()
+                __tts = weeutil.weeutil.archiveDaySpan(__ts)
+        except Exception as e:
+            logerr("cannot check fields: %s" % e)
+            __sqlkeys = None
+        
+        # aggregation values
+        __x=""
+        self.aggregate_fields = []
+        for __key,__vvv in enumerate(self.data_map):
+            __obs,__tim,__agg,__fmt = __vvv
+            if __tim=='' or __agg=='' or __agg=='attr':
+                continue
+            try:
+                if dbmanager is None:
+                    raise weewx.UnknownType(__obs)
+                if __sqlkeys is not None:
+                    weewx.xtypes.get_aggregate(__obs,__tts,__agg.lower(),dbmanager)
+                __supported = True
+            except weewx.CannotCalculate:
+                # type is known but there is no data at the moment
+                __supported = True
+            except (weewx.UnknownType,weewx.UnknownAggregation):
+                __supported = False
+            except weedb.OperationalError as e:
+                # Unknown types end up at the archive table, which raises
+                # OperationalError if there is no such column.
+                __supported = __obs in __sqlkeys
+                if __supported:
+                    logerr("%s.%s.%s %s" % (__obs,__tim,__agg,e))
+            except Exception as e:
+                # other errors may be temporary, so keep the field
+                logerr("%s.%s.%s %s" % (__obs,__tim,__agg,e))
+                __supported = True
+            if not __supported:
+                # unsupported field: fix to 'n.v.'
+                self.data_map[__key] = ('','','',__fmt)
+                __x="%s %s%s%s" % (__x,__obs,__tim.capitalize(),__agg.capitalize())
+                continue
+            self.aggregate_fields.append((__obs,__tim,__agg,
+                "%s%s%s" % (__obs,__tim.capitalize(),__agg.capitalize())))
+        if __x:
+            loginf("Fields not available, set to 'n.v.':%s" % __x)
+
+        # values read directly from the archive table
+        def __sql(columns, where):
+            __cols = [__i for __i in columns 
+                      if __sqlkeys is None or __i[1] in __sqlkeys]
+            if not __cols:
+                return None
+            return ("SELECT %s FROM %s WHERE %s" % (
+                        ",".join(("%s(%s)" % (__i[0],__i[1]) if __i[0] 
+                                  else __i[1]) for __i in __cols),
+                        dbmanager.table_name,where),
+                    [__i[2] for __i in __cols],
+                    [__i[3] for __i in __cols])
+        self.day_sql = __sql(self._DAY_COLUMNS,"dateTime>? AND dateTime<=?")
+        self.ago1_sql = __sql(self._AGO1_COLUMNS,"dateTime=? and dateTime<=?")
+        self.h1_sql = __sql(self._H1_COLUMNS,"dateTime>? and dateTime<=?")
+        __x = [__i[1] for __i in self._DAY_COLUMNS+self._AGO1_COLUMNS+self._H1_COLUMNS
+               if __sqlkeys is not None and __i[1] not in __sqlkeys]
+        if __x:
+            loginf("Columns not in archive: %s" % ", ".join(sorted(set(__x))))
+
     def __wns_umwandeln(self,record):    
         # convert to metric units
         record_m = weewx.units.to_METRICWX(record)
@@ -322,7 +426,7 @@ class RwsaThread(weewx.restx.RESTThread):
 
         __data = []
         
-        for key,vvv in enumerate(self._DATA_MAP):
+        for key,vvv in enumerate(self.data_map):
             # archive column name
             rkey = "%s%s%s" % (vvv[0],
                                vvv[1].capitalize(),
@@ -429,6 +533,12 @@ class RwsaThread(weewx.restx.RESTThread):
         # run parent class
         _datadict = super(RwsaThread,self).get_record(record,dbmanager)
 
+        # Check the field layout once. This is done here and not at thread
+        # start, because then all the services and their xtypes are set up.
+        if not self.fields_checked:
+            self.check_fields(dbmanager)
+            self.fields_checked = True
+
         # actual time stamp
         _time_ts = _datadict['dateTime']
         _sod_ts = weeutil.weeutil.startOfDay(_time_ts)
@@ -484,62 +594,30 @@ class RwsaThread(weewx.restx.RESTThread):
         try:
             # minimum and maximum temperature of the day
             # check for midnight, result is not valid then
-            if ('outTempDayMax' not in _datadict and _sod_ts<_time_ts):
-                _result = dbmanager.getSql(
-                    "SELECT MIN(outTemp),MAX(outTemp),MIN(windchill),"
-                    "MAX(UV) FROM %s "
-                    "WHERE dateTime>? AND dateTime<=?"
-                    % dbmanager.table_name, (_sod_ts,_time_ts))
-                if _result is not None:
-                    _datadict['outTempDayMin']=_result[0]
-                    _datadict['outTempDayMax']=_result[1]
-                    _datadict['windchillDayMin']=_result[2]
-                    _datadict['UVDayMax']=_result[3]
+            if (self.day_sql and 'outTempDayMax' not in _datadict and 
+                _sod_ts<_time_ts):
+                _result = dbmanager.getSql(self.day_sql[0],(_sod_ts,_time_ts))
+                RwsaThread.__add_sql_result(_datadict,self.day_sql,_result)
 
             # temperature and barometer change of the last hour
             if _ago1_ts is not None:
-                _result = dbmanager.getSql(
-                    "SELECT outTemp,barometer,pressure FROM %s "
-                    "WHERE dateTime=? and dateTime<=?"
-                    % dbmanager.table_name, (_ago1_ts,_time_ts))
-                if _result is not None:
-                    if 'outTemp1h' not in _datadict:
-                        _datadict['outTemp1h']=_result[0]
-                    if 'barometer1h' not in _datadict:
-                        _datadict['barometer1h']=_result[1]
-                    if 'pressure1h' not in _datadict:
-                        _datadict['pressure1h']=_result[2]
-                    weewx.units.obs_group_dict.setdefault('outTemp1h','group_temperature')
+                if self.ago1_sql:
+                    _result = dbmanager.getSql(self.ago1_sql[0],(_ago1_ts,_time_ts))
+                    RwsaThread.__add_sql_result(_datadict,self.ago1_sql,_result)
                 
-                _result = dbmanager.getSql(
-                    "SELECT MIN(windchill),MAX(radiation) FROM %s "
-                    "WHERE dateTime>? and dateTime<=?"
-                    % dbmanager.table_name, (_ago1_ts,_time_ts))
-                if _result is not None:
-                    if 'windchill1hMin' not in _datadict:
-                        _datadict['windchill1hMin']=_result[0]
-                    if 'radiation1hMax' not in _datadict:
-                        _datadict['radiation1hMax']=_result[1]
-                    weewx.units.obs_group_dict.setdefault('windchill1hMin','group_temperature')
-                    weewx.units.obs_group_dict.setdefault('radiation1hMax','group_radiation')
+                if self.h1_sql:
+                    _result = dbmanager.getSql(self.h1_sql[0],(_ago1_ts,_time_ts))
+                    RwsaThread.__add_sql_result(_datadict,self.h1_sql,_result)
 
         except weedb.OperationalError as e:
             log.debug("%s: Database OperationalError '%s'",self.protocol_name,e)
         except (ValueError, TypeError):
             pass
 
-        # aggregation values
-        for __key,__vvv in enumerate(self._DATA_MAP):
-            # field name
-            __obs=self._DATA_MAP[__key][0]
-            # time span
-            __tim=self._DATA_MAP[__key][1]
-            # aggregation type
-            __agg=self._DATA_MAP[__key][2]
-            # aggregation field name
-            __rky="%s%s%s" % (__obs,__tim.capitalize(),__agg.capitalize())
-            # get aggregation if __tim and __agg are not empty
-            if __tim!='' and __agg!='' and __rky not in _datadict:
+        # aggregation values, checked by check_fields() at startup
+        for __obs,__tim,__agg,__rky in self.aggregate_fields:
+            # get aggregation if not already in the record
+            if __rky not in _datadict:
                 try:
                     # time span
                     if __tim=='1h':
@@ -576,6 +654,17 @@ class RwsaThread(weewx.restx.RESTThread):
 
         return _datadict
         
+    @staticmethod
+    def __add_sql_result(datadict, sql, result):
+        """Add the result of a query prepared by check_fields() to the
+        record, unless the value is already there."""
+        if result is not None:
+            for __val,__rky,__grp in zip(result,sql[1],sql[2]):
+                if __rky not in datadict:
+                    datadict[__rky] = __val
+                if __grp:
+                    weewx.units.obs_group_dict.setdefault(__rky,__grp)
+
     def check_response(self,response):
         """Check the response from a HTTP post.
         